@@ -1,145 +1,236 @@
-import pygame
 import numpy as np
-import librosa
-import cv2
+import soundfile as sf
 import os
+import math
+import logging
+import queue
+import subprocess
+import threading
+import numba
+from concurrent.futures import ProcessPoolExecutor
+from numba import njit, prange
 from utils.logger import logger
 
+@njit(parallel=True, fastmath=True, cache=True)
+def render_frame(fb, bg, xs, ys, rs, cols):
+    # 直接在预分配的帧缓冲(H, W, 3)中光栅化所有小球
+    height, width = fb.shape[0], fb.shape[1]
+    for y in prange(height):
+        for x in range(width):
+            for c in range(3):
+                fb[y, x, c] = bg[c]
+    # 按顺序绘制，后面的小球覆盖前面的小球
+    for k in range(xs.shape[0]):
+        cx, cy, r = xs[k], ys[k], rs[k]
+        top = max(0, cy - r)
+        bottom = min(height, cy + r + 1)
+        for y in prange(top, bottom):
+            dy = y - cy
+            dx2 = r * r - dy * dy
+            if dx2 < 0:
+                continue
+            w = int(math.sqrt(dx2))
+            left = max(0, cx - w)
+            right = min(width, cx + w + 1)
+            for x in range(left, right):
+                for c in range(3):
+                    fb[y, x, c] = cols[k, c]
+
 class MusicVisualizer:
     def __init__(self, width=800, height=600):
         self.width = width
         self.height = height
+        self.fps = 30
         self.bg_color = (0, 0, 0)
         self.ball_color = (255, 255, 255)
-        pygame.init()
-        self.screen = pygame.display.set_mode((width, height))
-        pygame.display.set_caption('音乐可视化')
+        # 预分配一组帧缓冲循环使用。写入线程最多持有队列中的帧和正在写入的一批帧，
+        # 因此缓冲数比两者之和多1即可保证正在绘制的缓冲不会被写入线程读取
+        self.queue_size = 8
+        self.write_batch = 16
+        self._frames = np.zeros((self.queue_size + self.write_batch + 1, height, width, 3), dtype=np.uint8)
+        self._frame_slot = 0
+        self._bg = np.array(self.bg_color, dtype=np.uint8)
+        # 小球的横坐标和颜色系数在各帧间不变，只计算一次
+        self._xs = (width * np.arange(1, 11) / 11).astype(np.int32)
+        self._col_base = np.array([0, 100, 200], dtype=np.float32)
+        self._col_scale = np.array([255, 155, -200], dtype=np.float32)
 
     def load_audio(self, audio_path):
         # 加载音频文件并进行预处理
+        # librosa导入较慢（会连带导入scipy等），只在真正处理音频时导入
+        import librosa
         logger.info(f'开始加载音频文件: {audio_path}')
-        self.y, self.sr = librosa.load(audio_path)
-        self.stft = np.abs(librosa.stft(self.y))
-        self.frequencies = librosa.core.fft_frequencies(sr=self.sr)
-        self.times = librosa.core.frames_to_time(range(self.stft.shape[1]), sr=self.sr)
+        # 按原始采样率读取，跳过librosa默认的重采样
+        try:
+            self.y, self.sr = sf.read(audio_path, dtype='float32', always_2d=False)
+        except RuntimeError as e:
+            # soundfile无法解码时退回到librosa加载
+            logger.warning(f'soundfile读取失败，改用librosa加载: {str(e)}')
+            self.y, self.sr = librosa.load(audio_path, sr=None)
+        if self.y.ndim > 1:
+            # 多声道混合为单声道
+            self.y = self.y.mean(axis=1)
+        # 整个音频处理流程保持单精度，减少STFT和波段归约的内存访问量
+        self.y = self.y.astype(np.float32, copy=False)
+        # 使STFT帧率与视频帧率一致，10个波段的可视化不需要默认的2048点FFT
+        self.hop = max(256, self.sr // self.fps)
+        S = librosa.stft(self.y, n_fft=1024, hop_length=self.hop, dtype=np.complex64)
+        assert S.dtype == np.complex64
+        # 按列分块求幅值，再用reduceat一次性累加10个波段，不分配完整的幅值谱
+        n_bins, n_frames = S.shape
+        edges = np.linspace(0, n_bins, 11, dtype=np.intp)
+        counts = np.diff(edges).astype(np.float32)
+        self.bands_all = np.empty((10, n_frames), dtype=np.float32)
+        chunk = 2048
+        for start in range(0, n_frames, chunk):
+            magnitudes = np.abs(S[:, start:start + chunk])
+            self.bands_all[:, start:start + chunk] = np.add.reduceat(magnitudes, edges[:-1], axis=0)
+        self.bands_all /= counts[:, None]
+        # 使用全局最大值统一归一化，避免逐帧归一化造成的闪烁
+        self.bands_all /= self.bands_all.max() + 1e-9
+        assert self.bands_all.dtype == np.float32
         logger.info('音频文件加载完成')
 
     def get_frequency_bands(self, frame_index):
-        # 获取当前帧的频率数据
-        if frame_index >= self.stft.shape[1]:
-            return np.zeros(10)
-        magnitudes = self.stft[:, frame_index]
-        # 将频率分为10个波段
-        bands = np.array_split(magnitudes, 10)
-        return np.array([np.mean(band) for band in bands])
+        # 获取当前帧的频率数据（已在load_audio中预先计算）
+        if frame_index >= self.bands_all.shape[1]:
+            return np.zeros(10, dtype=np.float32)
+        return self.bands_all[:, frame_index]
+
+    def frame_geometry(self, frame_index):
+        # 计算单帧中所有小球的位置、大小和颜色
+        # 通过查找表将视频帧映射到对应的STFT帧
+        bands = self.get_frequency_bands(self.frame_lut[frame_index])
+        sin_t = math.sin(frame_index * 0.1)
+        ys = (self.height / 2 + bands * 100 * sin_t).astype(np.int32)
+        rs = (20 + bands * 30).astype(np.int32)
+        # 根据频率设置颜色：(R, G, B) = (255b, 100 + 155b, 200 - 200b)
+        cols = (self._col_base + bands[:, None] * self._col_scale).astype(np.uint8)
+        return self._xs, ys, rs, cols
+
+    def render(self, xs, ys, rs, cols):
+        # 按给定的小球参数绘制画面
+        fb = self._frames[self._frame_slot]
+        self._frame_slot = (self._frame_slot + 1) % len(self._frames)
+        render_frame(fb, self._bg, xs, ys, rs, cols)
+        # 返回连续的RGB帧缓冲，可原样写入ffmpeg管道
+        return fb
 
     def draw_frame(self, frame_index):
         # 绘制单帧画面
-        self.screen.fill(self.bg_color)
-        bands = self.get_frequency_bands(frame_index)
-        max_magnitude = np.max(bands)
-        if max_magnitude > 0:
-            bands = bands / max_magnitude
-
-        for i, magnitude in enumerate(bands):
-            # 计算小球位置和大小
-            x = self.width * (i + 1) / (len(bands) + 1)
-            y = self.height / 2 + magnitude * 100 * np.sin(frame_index * 0.1)
-            radius = 20 + magnitude * 30
-            
-            # 根据频率设置颜色
-            color = (int(255 * magnitude), 
-                    int(100 + 155 * magnitude), 
-                    int(200 * (1 - magnitude)))
-            
-            # 绘制小球
-            pygame.draw.circle(self.screen, color, (int(x), int(y)), int(radius))
-
-        pygame.display.flip()
-        return pygame.surfarray.array3d(self.screen)
+        return self.render(*self.frame_geometry(frame_index))
+
+    def _writer_loop(self, stream, frame_queue):
+        # 后台线程：从队列中批量取出帧写入ffmpeg管道，遇到None时结束
+        failed = False
+        done = False
+        while not done:
+            batch = [frame_queue.get()]
+            while len(batch) < self.write_batch:
+                try:
+                    batch.append(frame_queue.get_nowait())
+                except queue.Empty:
+                    break
+            # 结束标记总是最后一个入队
+            if batch[-1] is None:
+                batch.pop()
+                done = True
+            if failed:
+                # 管道已失效，继续取出剩余帧以免渲染线程阻塞
+                continue
+            try:
+                for frame_index, raw in batch:
+                    stream.write(raw)
+            except Exception as e:
+                logger.error(f'写入第 {frame_index} 帧时出错: {str(e)}')
+                failed = True
 
     def create_animation(self, audio_path, output_path):
         logger.info('开始创建音乐可视化动画')
         self.load_audio(audio_path)
-        duration = librosa.get_duration(y=self.y, sr=self.sr)
-        fps = 30
+        duration = len(self.y) / self.sr
+        fps = self.fps
         total_frames = int(duration * fps)
         logger.info(f'视频总帧数: {total_frames}, 时长: {duration:.2f}秒')
-        
-        # 尝试不同的编码器
-        codecs = ['mp4v', 'avc1', 'H264']
-        video = None
+
+        # 预先计算视频帧到STFT帧的映射表
+        self.frame_lut = np.minimum(
+            (np.arange(total_frames) * self.sr // (fps * self.hop)).astype(np.int32),
+            self.bands_all.shape[1] - 1
+        )
         
         # 确保输出路径是绝对路径
         if not os.path.isabs(output_path):
             output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_path)
-        
-        # 尝试不同的编码器直到成功
-        for codec in codecs:
-            try:
-                fourcc = cv2.VideoWriter_fourcc(*codec)
-                video = cv2.VideoWriter(output_path, fourcc, float(fps), (self.width, self.height))
-                if video.isOpened():
-                    logger.info(f'成功使用编码器 {codec}')
-                    break
-            except Exception as e:
-                logger.warning(f'编码器 {codec} 初始化失败: {str(e)}')
-                if video is not None:
-                    video.release()
-        
-        if not video.isOpened():
-            error_msg = f'无法创建视频写入器，请检查编码器是否支持或输出路径是否正确: {output_path}'
+
+        # 启动ffmpeg进程，通过管道直接接收RGB原始帧并同时合并音频
+        ffmpeg_cmd = [
+            'ffmpeg', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{self.width}x{self.height}', '-r', str(fps),
+            '-i', '-',
+            '-i', audio_path,
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-shortest',
+            output_path,
+        ]
+        try:
+            proc = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE)
+        except OSError as e:
+            error_msg = f'无法启动ffmpeg，请检查是否已正确安装: {str(e)}'
             logger.error(error_msg)
             raise Exception(error_msg)
-        
-        # 逐帧生成并写入视频
+
+        # 启动后台写入线程，使视频编码与画面渲染并行进行
+        frame_queue = queue.Queue(maxsize=self.queue_size)
+        writer = threading.Thread(target=self._writer_loop, args=(proc.stdin, frame_queue), daemon=True)
+        writer.start()
+
+        # 逐帧生成视频并交给写入线程
         logger.info('开始生成视频帧')
-        for frame_index in range(total_frames):
-            if frame_index % 100 == 0:  # 每100帧记录一次进度
-                logger.debug(f'正在处理第 {frame_index}/{total_frames} 帧')
-            frame = self.draw_frame(frame_index)
-            
-            # 验证帧数据
-            if frame is None or frame.size == 0:
-                logger.error(f'第 {frame_index} 帧数据无效')
-                continue
-                
-            # 确保帧数据类型和尺寸正确
-            frame = frame.astype(np.uint8)
-            if frame.shape[:2] != (self.height, self.width):
-                logger.warning(f'第 {frame_index} 帧尺寸不正确，进行调整')
-                frame = cv2.resize(frame, (self.width, self.height))
-            
-            # 将RGB转换为BGR格式
-            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            
+        last_key, last_raw = None, None
+        try:
+            for frame_index in range(total_frames):
+                # 每100帧记录一次进度，未开启DEBUG时不格式化日志
+                if frame_index % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('正在处理第 %d/%d 帧', frame_index, total_frames)
+                xs, ys, rs, cols = self.frame_geometry(frame_index)
+                # 小球参数与上一帧完全相同时（如静音段）直接复用上一帧画面
+                key = ys.tobytes() + rs.tobytes() + cols.tobytes()
+                if key != last_key:
+                    last_key, last_raw = key, self.render(xs, ys, rs, cols)
+                frame_queue.put((frame_index, last_raw))
+        finally:
+            # 发送结束标记并等待剩余帧写入完成
+            frame_queue.put(None)
+            writer.join()
             try:
-                video.write(frame)
-            except Exception as e:
-                logger.error(f'写入第 {frame_index} 帧时出错: {str(e)}')
-                continue
-        
-        video.release()
+                proc.stdin.close()
+            except OSError:
+                pass
+            proc.wait()
+
+        # ffmpeg异常退出时输出文件不完整，不能当作成功处理
+        if proc.returncode != 0:
+            error_msg = f'ffmpeg编码失败（退出码 {proc.returncode}）: {output_path}'
+            logger.error(error_msg)
+            raise subprocess.CalledProcessError(proc.returncode, ffmpeg_cmd)
+
         logger.info(f'视频生成完成: {output_path}')
-        
-        # 使用ffmpeg合并音频和视频
-        temp_video = output_path + '.temp.mp4'
-        os.rename(output_path, temp_video)
-        try:
-            # 使用ffmpeg将音频合并到视频中
-            ffmpeg_cmd = f'ffmpeg -i {temp_video} -i {audio_path} -c:v copy -c:a aac -strict experimental {output_path}'
-            os.system(ffmpeg_cmd)
-            os.remove(temp_video)  # 删除临时文件
-            logger.info('音频合并完成')
-        except Exception as e:
-            logger.error(f'音频合并失败: {str(e)}')
-            # 如果合并失败，恢复原视频文件
-            if os.path.exists(temp_video):
-                os.rename(temp_video, output_path)
+
+def _init_worker(num_threads):
+    # 限制每个进程中Numba的线程数，避免多进程同时渲染时线程过度竞争
+    numba.set_num_threads(num_threads)
+
+def _render_one(job):
+    # 在独立进程中处理单个音频文件，每个进程使用各自的可视化器
+    audio_path, output_path = job
+    logger.info(f'处理音频文件: {os.path.basename(audio_path)}')
+    MusicVisualizer().create_animation(audio_path, output_path)
+    return output_path
 
 def main():
     try:
-        visualizer = MusicVisualizer()
         # 设置输入输出路径
         downloads_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'downloads')
         output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output')
@@ -153,15 +244,18 @@ def main():
         if not audio_files:
             logger.error(f'在 {downloads_dir} 目录中未找到音频文件')
             return
-            
-        for audio_file in audio_files:
-            audio_path = os.path.join(downloads_dir, audio_file)
-            # 使用相同的文件名（但改为mp4扩展名）作为输出文件名
-            output_filename = os.path.splitext(audio_file)[0] + '.mp4'
-            output_path = os.path.join(output_dir, output_filename)
-            
-            logger.info(f'处理音频文件: {audio_file}')
-            visualizer.create_animation(audio_path, output_path)
+
+        # 使用相同的文件名（但改为mp4扩展名）作为输出文件名
+        jobs = [(os.path.join(downloads_dir, f), os.path.join(output_dir, os.path.splitext(f)[0] + '.mp4'))
+                for f in audio_files]
+
+        # 各音频文件相互独立，分配到多个进程并行处理
+        cpu_count = os.cpu_count() or 1
+        max_workers = min(len(jobs), cpu_count)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(max(1, cpu_count // max_workers),)) as executor:
+            for output_path in executor.map(_render_one, jobs):
+                logger.info(f'已完成: {output_path}')
     except Exception as e:
         logger.error(f'程序执行出错: {str(e)}')
         raise
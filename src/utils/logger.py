@@ -2,65 +2,42 @@ import logging
 import os
 from datetime import datetime
 
-class Logger:
-    _instance = None
-    _initialized = False
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-
-    def __init__(self):
-        if not Logger._initialized:
-            # 创建logs目录
-            log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-            os.makedirs(log_dir, exist_ok=True)
-
-            # 设置日志文件名
-            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-            log_file = os.path.join(log_dir, f'music_visualizer_{current_time}.log')
-
-            # 配置日志记录器
-            self.logger = logging.getLogger('MusicVisualizer')
-            self.logger.setLevel(logging.DEBUG)
-
-            # 创建文件处理器
-            file_handler = logging.FileHandler(log_file, encoding='utf-8')
-            file_handler.setLevel(logging.DEBUG)
-
-            # 创建控制台处理器
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.INFO)
-
-            # 设置日志格式
-            formatter = logging.Formatter(
-                '%(asctime)s - %(levelname)s - %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-            file_handler.setFormatter(formatter)
-            console_handler.setFormatter(formatter)
-
-            # 添加处理器到日志记录器
-            self.logger.addHandler(file_handler)
-            self.logger.addHandler(console_handler)
-
-            Logger._initialized = True
-
-    def debug(self, message):
-        self.logger.debug(message)
-
-    def info(self, message):
-        self.logger.info(message)
-
-    def warning(self, message):
-        self.logger.warning(message)
-
-    def error(self, message):
-        self.logger.error(message)
-
-    def critical(self, message):
-        self.logger.critical(message)
-
-# 创建全局日志实例
-logger = Logger()
\ No newline at end of file
+def _setup_logger():
+    # 配置日志记录器，模块首次导入时执行一次
+    logger = logging.getLogger('MusicVisualizer')
+    if logger.handlers:
+        return logger
+
+    # 创建logs目录
+    log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+
+    # 设置日志文件名
+    current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+    log_file = os.path.join(log_dir, f'music_visualizer_{current_time}.log')
+
+    logger.setLevel(logging.DEBUG)
+
+    # 创建文件处理器
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setLevel(logging.DEBUG)
+
+    # 创建控制台处理器
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+
+    # 设置日志格式
+    formatter = logging.Formatter(
+        '%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    file_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
+
+    # 添加处理器到日志记录器
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    return logger
+
+# 全局日志实例，直接使用标准库的Logger
+logger = _setup_logger()